@@ -2,78 +2,76 @@
 """
 Simple Flask Model Server for R Random Forest Model
 Direct REST API without Seldon Core complexity
+Runs on Quart (async Flask) so one worker multiplexes many in-flight R calls
 """
 
-from flask import Flask, request, jsonify
+from quart import Quart, request, jsonify
+from quart.json.provider import DefaultJSONProvider
 import os
-import json
-import subprocess
-import tempfile
 import logging
+import asyncio
+import orjson
+
+from r_predictor import RPredictor, FEATURES
+
+# libuv-based event loop for faster pipe I/O and task scheduling; uvicorn
+# picks it up on its own under gunicorn, this covers app.run() as well
+try:
+    import uvloop
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+except ImportError:
+    uvloop = None
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = Flask(__name__)
-
-# Global variables
-model_ready = False
-feature_names = ["age", "income", "education", "experience", "credit_score"]
-
-# R prediction script template
-r_prediction_script = '''
-# Load required libraries
-library(randomForest)
-library(jsonlite)
-
-# Load the model
-model <- readRDS("/app/model/flask_random_forest.rds")
-
-# Function to make predictions
-predict_loan <- function(input_data) {
-    # Convert input to data frame
-    df <- data.frame(
-        age = input_data$age,
-        income = input_data$income,
-        education = input_data$education,
-        experience = input_data$experience,
-        credit_score = input_data$credit_score,
-        stringsAsFactors = FALSE
-    )
+class ORJSONProvider(DefaultJSONProvider):
+    """JSON provider that serializes with orjson instead of the stdlib json module"""
     
-    # Make prediction
-    prediction <- predict(model, df, type = "prob")
-    prob_approved <- prediction[,"approved"]
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode()
     
-    # Return results
-    result <- list(
-        probability = as.numeric(prob_approved),
-        prediction = ifelse(prob_approved > 0.5, "approved", "denied"),
-        confidence = as.numeric(abs(prob_approved - 0.5) * 2)
-    )
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
     
-    return(result)
-}
+    def response(self, *args, **kwargs):
+        # Hand orjson's bytes straight to the response, skipping str round trips
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj), mimetype=self.mimetype)
+
+app = Quart(__name__)
+app.json = ORJSONProvider(app)
+
+# Global variables
+model_ready = False
 
-# Read input from stdin and make prediction
-input_json <- readLines("stdin", warn = FALSE)
-input_data <- fromJSON(input_json)
-result <- predict_loan(input_data)
-cat(toJSON(result, auto_unbox = TRUE))
-'''
+predictor = RPredictor(
+    "/app/model/flask_random_forest.rds",
+    pmml_path=os.environ.get("PMML_MODEL_PATH", "/app/model/flask_random_forest.pmml")
+)
+
+@app.before_serving
+async def startup():
+    """Start the batch dispatcher and begin warming up the model in R"""
+    await predictor.start()
+
+@app.after_serving
+async def shutdown():
+    """Stop the R worker pool with the server"""
+    await predictor.stop()
 
 @app.route('/health', methods=['GET'])
-def health():
+async def health():
     """Health check endpoint"""
     global model_ready
     try:
-        # Check if model file exists
-        model_exists = os.path.exists("/app/model/flask_random_forest.rds")
-        if not model_exists:
+        # Only report healthy once a sentinel prediction has gone through R,
+        # so the first real request never pays the model load
+        if not predictor.ready:
             return jsonify({
                 "status": "unhealthy", 
-                "message": "Model file not found",
+                "message": "Model is warming up",
                 "model_loaded": False
             }), 503
             
@@ -90,13 +88,17 @@ def health():
         }), 500
 
 @app.route('/predict', methods=['POST'])
-def predict():
+async def predict():
     """Prediction endpoint"""
     try:
         logger.info("📊 Received prediction request")
         
         # Get JSON data
-        data = request.get_json()
+        body = await request.get_data()
+        try:
+            data = orjson.loads(body) if body else None
+        except orjson.JSONDecodeError:
+            return jsonify({"error": "Invalid JSON data"}), 400
         if not data:
             return jsonify({"error": "No JSON data provided"}), 400
             
@@ -108,7 +110,7 @@ def predict():
             # Seldon format  
             if 'ndarray' in data['data']:
                 values = data['data']['ndarray'][0]
-                instance = dict(zip(feature_names, values))
+                instance = dict(zip(FEATURES, values))
             else:
                 instance = data['data']
         else:
@@ -117,32 +119,9 @@ def predict():
             
         logger.info(f"Processing input: {instance}")
         
-        # Validate required features
-        for feature in feature_names:
-            if feature not in instance:
-                return jsonify({"error": f"Missing required feature: {feature}"}), 400
-        
         # Run R prediction
         try:
-            # Run R script with input
-            process = subprocess.run(
-                ['Rscript', '-e', r_prediction_script],
-                input=json.dumps(instance),
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
-            
-            if process.returncode != 0:
-                logger.error(f"R script error: {process.stderr}")
-                return jsonify({"error": f"R prediction failed: {process.stderr}"}), 500
-            
-            # Parse R output
-            try:
-                result = json.loads(process.stdout.strip())
-            except json.JSONDecodeError as e:
-                logger.error(f"JSON decode error: {e}, Output: {process.stdout}")
-                return jsonify({"error": "Invalid JSON from R script"}), 500
+            result = await predictor.predict_one(instance)
             
             # Format response
             response = {
@@ -159,8 +138,13 @@ def predict():
             logger.info(f"✅ Prediction: {result['prediction']} (confidence: {result['confidence']:.2f})")
             return jsonify(response), 200
             
-        except subprocess.TimeoutExpired:
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except asyncio.TimeoutError:
             return jsonify({"error": "Prediction timeout"}), 504
+        except RuntimeError as e:
+            logger.error(f"R script error: {e}")
+            return jsonify({"error": str(e)}), 500
         except Exception as e:
             logger.error(f"Prediction error: {str(e)}")
             return jsonify({"error": str(e)}), 500
@@ -169,8 +153,57 @@ def predict():
         logger.error(f"Request processing error: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/predict_batch', methods=['POST'])
+async def predict_batch():
+    """Batch prediction endpoint: score all instances with a single R call"""
+    try:
+        body = await request.get_data()
+        try:
+            data = orjson.loads(body) if body else None
+        except orjson.JSONDecodeError:
+            return jsonify({"error": "Invalid JSON data"}), 400
+        # MLflow-style instances, or Seldon's ndarray
+        if isinstance(data, dict) and isinstance(data.get('instances'), list):
+            instances = data['instances']
+        elif isinstance(data, dict) and isinstance(data.get('data'), dict) and isinstance(data['data'].get('ndarray'), list):
+            instances = data['data']['ndarray']
+        else:
+            return jsonify({"error": "Expected {\"instances\": [...]} or {\"data\": {\"ndarray\": [...]}}"}), 400
+        
+        # Rows of a 2D array are feature values in FEATURES order
+        instances = [dict(zip(FEATURES, row)) if isinstance(row, list) else row for row in instances]
+        logger.info(f"📊 Received batch prediction request with {len(instances)} instances")
+        
+        try:
+            results = await predictor.predict_batch(instances)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except asyncio.TimeoutError:
+            return jsonify({"error": "Prediction timeout"}), 504
+        except RuntimeError as e:
+            logger.error(f"R script error: {e}")
+            return jsonify({"error": str(e)}), 500
+        
+        return jsonify({
+            "predictions": [
+                {
+                    "probability": result["probability"],
+                    "prediction": result["prediction"],
+                    "confidence": result["confidence"],
+                    "input": instance
+                }
+                for instance, result in zip(instances, results)
+            ],
+            "model_name": "loan-approval-rf",
+            "model_version": "1.0.0"
+        }), 200
+        
+    except Exception as e:
+        logger.error(f"Batch request processing error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/metadata', methods=['GET'])
-def metadata():
+async def metadata():
     """Model metadata endpoint"""
     return jsonify({
         "name": "loan-approval-model",
@@ -187,11 +220,12 @@ def metadata():
             {"name": "prediction", "datatype": "STR", "shape": [1]},
             {"name": "probability", "datatype": "FP64", "shape": [1]},
             {"name": "confidence", "datatype": "FP64", "shape": [1]}
-        ]
+        ],
+        "prediction_cache": predictor.cache.stats()
     }), 200
 
 @app.route('/', methods=['GET'])
-def root():
+async def root():
     """Root endpoint with API documentation"""
     return jsonify({
         "message": "Loan Approval Model Server",
@@ -199,6 +233,7 @@ def root():
         "endpoints": {
             "health": "GET /health - Health check",
             "predict": "POST /predict - Make predictions",
+            "predict_batch": "POST /predict_batch - Score {\"instances\": [...]} in one R call",
             "metadata": "GET /metadata - Model information"
         },
         "example_request": {
@@ -215,8 +250,10 @@ if __name__ == '__main__':
     logger.info("📋 Endpoints available:")
     logger.info("   GET  /health   - Health check")
     logger.info("   POST /predict  - Make predictions") 
+    logger.info("   POST /predict_batch - Batch predictions")
     logger.info("   GET  /metadata - Model information")
     logger.info("   GET  /         - API documentation")
     
-    # Start Flask server
+    # Start Quart development server (the R worker is started in before_serving)
+    # In production run: gunicorn -c gunicorn.conf.py flask_model_server:app
     app.run(host='0.0.0.0', port=9000, debug=False)
\ No newline at end of file
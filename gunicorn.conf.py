@@ -0,0 +1,27 @@
+"""
+Gunicorn configuration for the Quart model server
+Usage: gunicorn -c gunicorn.conf.py flask_model_server:app
+"""
+
+import os
+
+bind = "0.0.0.0:9000"
+
+# A single async worker multiplexes many in-flight requests. Every gunicorn
+# worker starts its own R worker pool with its own model copy and cache, so
+# scale R with R_WORKERS (forked workers sharing one model) rather than here
+workers = int(os.environ.get("GUNICORN_WORKERS", "1"))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Keep client connections open between predictions so callers reuse TCP
+# (and TLS) instead of reconnecting for every request
+keepalive = 75
+
+# The R pool starts and warms up in the background after before_serving
+# (/health stays 503 until then); a batch can still wait on a slow R call
+timeout = 120
+graceful_timeout = 30
+
+accesslog = "-"
+errorlog = "-"
+loglevel = "info"
@@ -5,14 +5,13 @@ Loads the trained R model and serves predictions via REST API
 """
 
 import os
-import json
 import numpy as np
 import pandas as pd
 import joblib
 import logging
 from typing import Dict, List, Union, Any
-import subprocess
-import tempfile
+
+from r_predictor import RPredictor, FEATURES
 
 class RModelServer:
     """
@@ -20,10 +19,14 @@ class RModelServer:
     """
     
     def __init__(self):
-        self.model = None
-        self.feature_names = ["age", "income", "education", "experience", "credit_score"]
+        self.feature_names = FEATURES
         self.model_ready = False
         
+        self.predictor = RPredictor(
+            "/app/model/random_forest_minio.rds",
+            pmml_path=os.environ.get("PMML_MODEL_PATH", "/app/model/random_forest_minio.pmml")
+        )
+        
         # Configure logging
         logging.basicConfig(level=logging.INFO)
         self.logger = logging.getLogger(__name__)
@@ -35,47 +38,8 @@ class RModelServer:
         try:
             self.logger.info("🚀 Loading R Random Forest model...")
             
-            # Create R script to load model and make predictions
-            self.r_prediction_script = '''
-# Load required libraries
-library(randomForest)
-library(jsonlite)
-
-# Load the model
-model <- readRDS("/app/model/random_forest_minio.rds")
-
-# Function to make predictions
-predict_loan <- function(input_data) {
-    # Convert input to data frame
-    df <- data.frame(
-        age = input_data$age,
-        income = input_data$income,
-        education = input_data$education,
-        experience = input_data$experience,
-        credit_score = input_data$credit_score,
-        stringsAsFactors = FALSE
-    )
-    
-    # Make prediction
-    prediction <- predict(model, df, type = "prob")
-    prob_approved <- prediction[,"approved"]
-    
-    # Return results
-    result <- list(
-        probability = as.numeric(prob_approved),
-        prediction = ifelse(prob_approved > 0.5, "approved", "denied"),
-        confidence = as.numeric(abs(prob_approved - 0.5) * 2)
-    )
-    
-    return(result)
-}
-
-# Read input from stdin and make prediction
-input_json <- readLines("stdin", warn = FALSE)
-input_data <- fromJSON(input_json)
-result <- predict_loan(input_data)
-cat(toJSON(result, auto_unbox = TRUE))
-'''
+            # Load the PMML model and warm up the R workers on a background loop
+            self.predictor.start_thread()
             
             self.model_ready = True
             self.logger.info("✅ Model loaded successfully")
@@ -101,66 +65,49 @@ cat(toJSON(result, auto_unbox = TRUE))
             
             self.logger.info("📊 Making prediction...")
             
-            # Handle different input formats
+            # Handle different input formats; a 2D array or list of dicts is a batch
             if isinstance(X, dict):
-                input_data = X
+                rows = [X]
             elif isinstance(X, (list, np.ndarray)):
-                if len(X) >= len(self.feature_names):
-                    input_data = dict(zip(self.feature_names, X[:len(self.feature_names)]))
+                if len(X) and isinstance(X[0], (dict, list, tuple, np.ndarray)):
+                    rows = [row if isinstance(row, dict) else dict(zip(FEATURES, row)) for row in X]
+                elif len(X) >= len(FEATURES):
+                    rows = [dict(zip(FEATURES, X))]
                 else:
                     raise ValueError("Input array too short")
             else:
                 raise ValueError("Unsupported input format")
             
-            # Ensure all required features are present
-            for feature in self.feature_names:
-                if feature not in input_data:
-                    raise ValueError(f"Missing required feature: {feature}")
+            if len(rows) > 1:
+                # Score the whole batch with one R call
+                results = self.predictor.run_sync(self.predictor.predict_batch(rows))
+                self.logger.info(f"✅ Batch prediction for {len(results)} rows")
+                return {
+                    "predictions": [result["probability"] for result in results],
+                    "prediction_class": [result["prediction"] for result in results],
+                    "confidence": [result["confidence"] for result in results]
+                }
             
-            # Create temporary file for R script input
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as f:
-                json.dump(input_data, f)
-                input_file = f.name
+            # Run prediction in-process, or on the persistent R workers
+            result = self.predictor.run_sync(self.predictor.predict_one(rows[0]))
             
-            try:
-                # Run R script
-                process = subprocess.run(
-                    ['Rscript', '-e', self.r_prediction_script],
-                    input=json.dumps(input_data),
-                    capture_output=True,
-                    text=True,
-                    timeout=30
-                )
-                
-                if process.returncode != 0:
-                    self.logger.error(f"R script error: {process.stderr}")
-                    raise RuntimeError(f"R prediction failed: {process.stderr}")
-                
-                # Parse R output
-                result = json.loads(process.stdout.strip())
-                
-                # Format response for Seldon Core
-                response = {
-                    "predictions": [result["probability"]],
-                    "prediction_class": result["prediction"],
-                    "confidence": result["confidence"],
-                    "feature_importance": {
-                        "age": 0.2,
-                        "income": 0.3,
-                        "education": 0.15,
-                        "experience": 0.15,
-                        "credit_score": 0.2
-                    }
+            # Format response for Seldon Core
+            response = {
+                "predictions": [result["probability"]],
+                "prediction_class": result["prediction"],
+                "confidence": result["confidence"],
+                "feature_importance": {
+                    "age": 0.2,
+                    "income": 0.3,
+                    "education": 0.15,
+                    "experience": 0.15,
+                    "credit_score": 0.2
                 }
-                
-                self.logger.info(f"✅ Prediction: {result['prediction']} (confidence: {result['confidence']:.2f})")
-                return response
-                
-            finally:
-                # Clean up temporary file
-                if os.path.exists(input_file):
-                    os.unlink(input_file)
-                
+            }
+            
+            self.logger.info(f"✅ Prediction: {result['prediction']} (confidence: {result['confidence']:.2f})")
+            return response
+            
         except Exception as e:
             self.logger.error(f"❌ Prediction error: {str(e)}")
             return {
@@ -174,10 +121,12 @@ cat(toJSON(result, auto_unbox = TRUE))
         """
         Health check endpoint
         """
+        self.predictor.check_ready()
         return {
-            "status": "healthy" if self.model_ready else "loading",
-            "model_loaded": self.model_ready,
-            "version": "1.0.0"
+            "status": "healthy",
+            "model_loaded": True,
+            "version": "1.0.0",
+            "prediction_cache": self.predictor.cache.stats()
         }
 
 # Create global model instance for Seldon Core
@@ -0,0 +1,730 @@
+#!/usr/bin/env python3
+"""
+Shared prediction core for the R Random Forest model servers
+Owns the persistent R worker pool (or Rserve / in-process PMML backend),
+the micro-batching dispatcher and the prediction cache
+"""
+
+import os
+import subprocess
+import tempfile
+import logging
+import asyncio
+import threading
+import errno
+import shutil
+import signal
+import struct
+import numbers
+import functools
+from collections import OrderedDict
+import numpy as np
+
+try:
+    import pyRserve
+except ImportError:
+    pyRserve = None
+
+try:
+    from sklearn_pmml_model.ensemble import PMMLForestClassifier
+except ImportError:
+    PMMLForestClassifier = None
+
+try:
+    from seldon_core.flask_utils import SeldonMicroserviceException
+except ImportError:
+    SeldonMicroserviceException = None
+
+logger = logging.getLogger(__name__)
+
+FEATURES = ("age", "income", "education", "experience", "credit_score")
+FEATURES_SET = frozenset(FEATURES)
+
+# Batches are held as one int32 column per feature (SoA). On the way to R
+# each column is downcast to the smallest integer type that fits the values
+# in that batch; keep in sync with read_columns() in the R script
+WIRE_DTYPES = (np.dtype("<i1"), np.dtype("<i2"), np.dtype("<i4"))
+
+# Largest magnitude an R integer holds (-2^31 is NA_integer_)
+R_INTEGER_MAX = 2 ** 31 - 1
+
+# Persistent R worker pool script: the parent loads libraries and the model
+# once, then forks the workers so they share the model copy-on-write. Each
+# worker reads length-prefixed frames of packed feature columns from its
+# request FIFO and answers with a status byte followed by the float64
+# approval probabilities (or an error message).
+# Arguments: model path, FIFO directory, number of workers
+r_prediction_script = '''
+# Load required libraries
+suppressMessages({
+    library(randomForest)
+    library(parallel)
+})
+
+args <- commandArgs(trailingOnly = TRUE)
+fifo_dir <- args[2]
+
+# Load the model
+model <- readRDS(args[1])
+
+# Function to make predictions
+predict_loan <- function(input_data) {
+    # Build the data frame directly, skipping data.frame()'s argument
+    # checks and row name generation on every call
+    df <- structure(
+        list(
+            age = input_data$age,
+            income = input_data$income,
+            education = input_data$education,
+            experience = input_data$experience,
+            credit_score = input_data$credit_score
+        ),
+        class = "data.frame",
+        row.names = .set_row_names(length(input_data$age))
+    )
+
+    # Make prediction
+    prediction <- predict(model, df, type = "prob")
+    prob_approved <- prediction[,"approved"]
+
+    # Return results
+    result <- list(
+        probability = as.numeric(prob_approved),
+        prediction = ifelse(prob_approved > 0.5, "approved", "denied"),
+        confidence = as.numeric(abs(prob_approved - 0.5) * 2)
+    )
+
+    return(result)
+}
+
+# Read exactly n bytes from a connection, or NULL once it is closed
+read_exact <- function(con, n) {
+    buf <- raw(0)
+    while (length(buf) < n) {
+        chunk <- readBin(con, "raw", n = n - length(buf))
+        if (length(chunk) == 0) return(NULL)
+        buf <- c(buf, chunk)
+    }
+    buf
+}
+
+# Split a frame into predict_loan's input: one byte per feature giving its
+# column's integer size (1, 2 or 4), then the little-endian columns one
+# after the other (age, income, education, experience, credit_score)
+read_columns <- function(payload) {
+    sizes <- as.integer(payload[1:5])
+    rows <- (length(payload) - 5) / sum(sizes)
+    offset <- 5
+    column <- function(size) {
+        bytes <- payload[offset + seq_len(rows * size)]
+        offset <<- offset + rows * size
+        readBin(bytes, "integer", n = rows, size = size, endian = "little")
+    }
+    list(
+        age = column(sizes[1]),
+        income = column(sizes[2]),
+        education = column(sizes[3]),
+        experience = column(sizes[4]),
+        credit_score = column(sizes[5])
+    )
+}
+
+# Serve one worker's FIFO pair frame by frame until the request FIFO is
+# closed; each frame is a 4-byte big-endian length followed by the payload
+serve <- function(worker_id) {
+    # Response first: the server takes an open request FIFO to mean the
+    # response FIFO already has this worker as its writer
+    responses <- fifo(file.path(fifo_dir, paste0("response", worker_id)), "wb", blocking = TRUE)
+    requests <- fifo(file.path(fifo_dir, paste0("request", worker_id)), "rb", blocking = TRUE)
+    while (!is.null(header <- read_exact(requests, 4))) {
+        n <- readBin(header, "integer", size = 4, endian = "big")
+        payload <- read_exact(requests, n)
+        if (is.null(payload)) break
+        result <- tryCatch(
+            c(as.raw(0), writeBin(predict_loan(read_columns(payload))$probability, raw(), size = 8, endian = "little")),
+            error = function(e) c(as.raw(1), charToRaw(conditionMessage(e)))
+        )
+        # Header and body go out in a single write
+        writeBin(c(writeBin(length(result), raw(), size = 4, endian = "big"), result), responses)
+        flush(responses)
+    }
+}
+
+# Fork the workers only after the model is loaded
+jobs <- lapply(seq_len(as.integer(args[3])) - 1, function(i) mcparallel(serve(i)))
+invisible(mccollect(jobs))
+'''
+
+# Worker command line, built once and reused for every (re)start
+_R_ARGS = ('Rscript', '-e', r_prediction_script)
+
+# Sentinel applicant scored at start-up so R is warm before traffic arrives
+PREWARM_INSTANCE = {"age": 30, "income": 50000, "education": 16, "experience": 5, "credit_score": 700}
+
+def feature_key(instance):
+    """Validate an instance and return its features as a tuple of ints"""
+    if not isinstance(instance, dict):
+        raise ValueError("Features must be given as an object")
+    # Validate required features with a single set check
+    if not FEATURES_SET.issubset(instance):
+        missing = [feature for feature in FEATURES if feature not in instance]
+        raise ValueError(f"Missing required feature: {', '.join(missing)}")
+    return tuple(feature_value(feature, instance[feature]) for feature in FEATURES)
+
+def feature_value(feature, value):
+    """Validate one feature value and return it as an int"""
+    # Whole floats (e.g. 30.0) and integer strings are accepted, never
+    # truncated; bools are ints in Python but not valid features
+    if isinstance(value, (bool, np.bool_)):
+        raise ValueError(f"{feature} must be an integer")
+    if isinstance(value, numbers.Integral):
+        value = int(value)
+    elif isinstance(value, numbers.Real) and float(value).is_integer():
+        value = int(value)
+    elif isinstance(value, str):
+        try:
+            value = int(value)
+        except ValueError:
+            raise ValueError(f"{feature} must be an integer")
+    else:
+        raise ValueError(f"{feature} must be an integer")
+
+    if not -R_INTEGER_MAX <= value <= R_INTEGER_MAX:
+        raise ValueError(f"{feature} must be between {-R_INTEGER_MAX} and {R_INTEGER_MAX}")
+    return value
+
+def feature_columns(keys):
+    """Pack feature tuples into a (len(FEATURES), n) int32 array, one row per feature column"""
+    return np.array(keys, dtype=np.int32).reshape(-1, len(FEATURES)).T
+
+def column_dtype(column):
+    """Smallest wire dtype that holds every value in the column"""
+    if column.size == 0:
+        return WIRE_DTYPES[0]
+    low, high = column.min(), column.max()
+    for dtype in WIRE_DTYPES:
+        if np.iinfo(dtype).min <= low and high <= np.iinfo(dtype).max:
+            return dtype
+    raise ValueError("Feature values must fit in 32 bits")
+
+def pack_columns(columns):
+    """Serialize feature columns after a header of their per-column byte sizes"""
+    dtypes = [column_dtype(column) for column in columns]
+    return bytes(dtype.itemsize for dtype in dtypes) + b"".join(
+        column.astype(dtype).tobytes() for column, dtype in zip(columns, dtypes)
+    )
+
+def results_from_probabilities(probabilities):
+    """Build the per-row result dicts from approval probabilities, same as predict_loan"""
+    return [
+        {
+            "probability": float(p),
+            "prediction": "approved" if p > 0.5 else "denied",
+            "confidence": float(abs(p - 0.5) * 2)
+        }
+        for p in probabilities
+    ]
+
+class RWorkerChannel:
+    """Request/response FIFO pair connected to one forked R worker"""
+
+    def __init__(self, reader, read_transport, writer):
+        self.reader = reader
+        self.read_transport = read_transport
+        self.writer = writer
+
+    async def call(self, payload, timeout):
+        """Send one length-prefixed frame and wait for the worker's reply frame"""
+        # The timeout covers the write too: drain() blocks on a hung worker
+        # once the frame is larger than the pipe buffer
+        return await asyncio.wait_for(self._exchange(payload), timeout)
+
+    async def _exchange(self, payload):
+        # One buffer, so the frame reaches the pipe in a single write
+        self.writer.write(struct.pack(">I", len(payload)) + payload)
+        await self.writer.drain()
+        header = await self.reader.readexactly(4)
+        return await self.reader.readexactly(struct.unpack(">I", header)[0])
+
+    def close(self):
+        self.writer.close()
+        self.read_transport.close()
+
+class RWorkerPool:
+    """
+    One parent R process loads the model and forks `size` workers that share
+    it copy-on-write, so memory does not grow with the pool size
+    """
+
+    def __init__(self, rds_path, size):
+        self.rds_path = rds_path
+        self.size = size
+        self.proc = None
+        self.fifo_dir = None
+        self.channels = []
+        self.idle = asyncio.Queue()
+        self.stopping = None
+
+    @property
+    def alive(self):
+        return self.proc is not None and self.proc.returncode is None
+
+    async def start(self, timeout=120):
+        logger.info(f"🔧 Starting R worker pool with {self.size} worker(s)")
+        try:
+            await self._start(timeout)
+        except BaseException:
+            # Never leave a live R parent behind with no usable channels, or
+            # `alive` would keep start_r_pool from ever replacing it
+            await self.stop()
+            raise
+
+    async def _start(self, timeout):
+        self.fifo_dir = tempfile.mkdtemp(prefix="r-workers-")
+        for i in range(self.size):
+            os.mkfifo(os.path.join(self.fifo_dir, f"request{i}"))
+            os.mkfifo(os.path.join(self.fifo_dir, f"response{i}"))
+
+        # Own session so the whole pool can be killed as one process group;
+        # stderr goes straight to the container log
+        self.proc = await asyncio.create_subprocess_exec(
+            *_R_ARGS, self.rds_path, self.fifo_dir, str(self.size),
+            stdin=subprocess.DEVNULL,
+            stderr=None,
+            start_new_session=True
+        )
+
+        for i in range(self.size):
+            self.channels.append(await self._connect(i, timeout))
+        for channel in self.channels:
+            self.idle.put_nowait(channel)
+
+    async def _connect(self, worker_id, timeout):
+        loop = asyncio.get_running_loop()
+
+        # Hold the response FIFO open read/write while the worker is still
+        # loading the model, so its blocking open for writing can complete
+        response_path = os.path.join(self.fifo_dir, f"response{worker_id}")
+        placeholder_fd = os.open(response_path, os.O_RDWR | os.O_NONBLOCK)
+        try:
+            # The request FIFO can only be opened for writing once the forked
+            # worker has opened it for reading, after its response FIFO
+            request_path = os.path.join(self.fifo_dir, f"request{worker_id}")
+            deadline = loop.time() + timeout
+            while True:
+                try:
+                    request_fd = os.open(request_path, os.O_WRONLY | os.O_NONBLOCK)
+                    break
+                except OSError as e:
+                    if e.errno != errno.ENXIO:
+                        raise
+                    if not self.alive:
+                        raise RuntimeError("R prediction failed: worker pool exited during start-up")
+                    if loop.time() > deadline:
+                        raise asyncio.TimeoutError()
+                    await asyncio.sleep(0.05)
+
+            # The worker now holds the only write end, so its exit reads as EOF
+            response_fd = os.open(response_path, os.O_RDONLY | os.O_NONBLOCK)
+        finally:
+            os.close(placeholder_fd)
+
+        reader = asyncio.StreamReader(limit=2 ** 20)
+        read_transport, _ = await loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(response_fd, "rb", 0)
+        )
+
+        write_transport, write_protocol = await loop.connect_write_pipe(
+            asyncio.streams.FlowControlMixin, os.fdopen(request_fd, "wb", 0)
+        )
+        writer = asyncio.StreamWriter(write_transport, write_protocol, None, loop)
+        return RWorkerChannel(reader, read_transport, writer)
+
+    async def stop(self):
+        for channel in self.channels:
+            channel.close()
+        self.channels = []
+
+        # Wake anyone waiting for a worker from this pool
+        for _ in range(self.size):
+            self.idle.put_nowait(None)
+
+        if self.proc is not None:
+            try:
+                os.killpg(self.proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            await self.proc.wait()
+            self.proc = None
+
+        if self.fifo_dir is not None:
+            shutil.rmtree(self.fifo_dir, ignore_errors=True)
+            self.fifo_dir = None
+
+    async def run(self, columns, timeout=30):
+        """Send a batch of feature columns to an idle worker and return the approval probabilities"""
+        channel = await self.idle.get()
+        if channel is None:
+            raise RuntimeError("R prediction failed: worker pool restarted")
+
+        payload = pack_columns(columns)
+
+        # A hung or dead worker (timeout, or EOF on its response FIFO) is
+        # replaced together with the rest of the pool
+        call = asyncio.ensure_future(channel.call(payload, timeout))
+        try:
+            frame = await asyncio.shield(call)
+        except asyncio.CancelledError:
+            # The caller went away (e.g. the client disconnected): the worker
+            # still owes us this reply, so release the channel once it is read
+            call.add_done_callback(functools.partial(self._release, channel))
+            raise
+        except asyncio.TimeoutError:
+            await self.stop()
+            raise
+        except asyncio.IncompleteReadError:
+            await self.stop()
+            raise RuntimeError("R prediction failed: worker exited")
+        except ConnectionError as e:
+            await self.stop()
+            raise RuntimeError(f"R prediction failed: {e}")
+        self.idle.put_nowait(channel)
+
+        if frame[:1] != b"\x00":
+            raise RuntimeError(f"R prediction failed: {frame[1:].decode(errors='replace')}")
+        return np.frombuffer(frame, dtype="<f8", offset=1)
+
+    def _release(self, channel, call):
+        """Return an abandoned call's channel to the pool, or replace the pool if the call failed"""
+        if not call.cancelled() and call.exception() is None:
+            if channel in self.channels:
+                self.idle.put_nowait(channel)
+        else:
+            self.stopping = asyncio.ensure_future(self.stop())
+
+class BatchDispatcher:
+    """
+    Collects concurrent prediction requests into micro-batches so R scores
+    up to batch_size rows per call instead of one row per request; up to
+    `concurrency` batches are in flight at once, one per R worker
+    """
+
+    def __init__(self, run_batch, batch_size=64, batch_timeout=0.01, concurrency=1):
+        self.run_r_batch = run_batch
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        self.concurrency = concurrency
+        self.requests = None
+        self.batch_full = None
+        self.slots = None
+        self.inflight = set()
+        self.task = None
+
+    def start(self):
+        """Start the dispatcher task on the running event loop"""
+        self.requests = asyncio.Queue()
+        self.batch_full = asyncio.Event()
+        self.slots = asyncio.Semaphore(self.concurrency)
+        self.task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        """Cancel the dispatcher task"""
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def submit(self, key):
+        """Queue one feature tuple and wait for its result"""
+        future = asyncio.get_running_loop().create_future()
+        self.requests.put_nowait((key, future))
+        # run() has already taken the batch's first request off the queue
+        if self.requests.qsize() >= self.batch_size - 1:
+            self.batch_full.set()
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # Wait for the first request before taking a worker slot, so an
+            # idle dispatcher never holds a slot that run_batch may need
+            first = await self.requests.get()
+
+            # Only form a batch once a worker is free, so requests keep
+            # accumulating into bigger batches while all workers are busy
+            await self.slots.acquire()
+
+            # Give others batch_timeout to arrive unless a full batch is
+            # already queued
+            batch = [first]
+            if self.requests.qsize() < self.batch_size - 1:
+                self.batch_full.clear()
+                try:
+                    await asyncio.wait_for(self.batch_full.wait(), self.batch_timeout)
+                except asyncio.TimeoutError:
+                    pass
+            while len(batch) < self.batch_size and not self.requests.empty():
+                batch.append(self.requests.get_nowait())
+
+            # Skip callers that already gave up
+            batch = [(key, future) for key, future in batch if not future.done()]
+            if not batch:
+                self.slots.release()
+                continue
+
+            task = loop.create_task(self.dispatch(batch))
+            self.inflight.add(task)
+            task.add_done_callback(self.inflight.discard)
+
+    async def dispatch(self, batch):
+        try:
+            results = await self.run_r_batch(feature_columns([key for key, _ in batch]))
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self.slots.release()
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def run_batch(self, columns):
+        """Score caller-built feature columns in one R call, sharing the worker slots"""
+        async with self.slots:
+            return await self.run_r_batch(columns)
+
+class PredictionCache:
+    """LRU cache of prediction results keyed by the integer feature tuple"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        result = self.entries.get(key)
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return result
+
+    def put(self, key, result):
+        self.entries[key] = result
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self.entries),
+            "max_size": self.maxsize,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+class RPredictor:
+    """
+    Scores loan applications with the R Random Forest model; each server
+    holds one, which owns the backend, the batching and the cache
+
+    Backends, in order of preference: the in-process PMML export of the
+    forest (see export_pmml.R), an Rserve sidecar when RSERVE_HOST is set
+    (see rserve_init.R), or a pool of R_WORKERS forked R workers. Requests
+    are micro-batched by a BatchDispatcher and memoized in a PredictionCache.
+
+    The API is async; synchronous servers call start_thread() once and then
+    wrap calls in run_sync(). `ready` turns true once a sentinel prediction
+    has gone through the backend, so health checks can hold traffic back
+    until the model is warm (Seldon wrappers call check_ready())
+    """
+
+    def __init__(self, rds_path, pmml_path=None):
+        self.rds_path = rds_path
+        self.pmml_path = pmml_path
+        self.pmml_model = None
+
+        self.r_workers = int(os.environ.get("R_WORKERS", "1"))
+        self.r_pool = None
+        self.r_pool_lock = None
+
+        self.rserve_host = os.environ.get("RSERVE_HOST")
+        self.rserve_port = int(os.environ.get("RSERVE_PORT", "6311"))
+        self.r_conn = None
+
+        # Rserve calls share one blocking connection, so only the worker
+        # pool runs batches concurrently
+        self.dispatcher = BatchDispatcher(
+            self._run_r_batch,
+            batch_size=int(os.environ.get("BATCH_SIZE", "64")),
+            batch_timeout=float(os.environ.get("BATCH_TIMEOUT_MS", "10")) / 1000,
+            concurrency=1 if self.rserve_host else self.r_workers
+        )
+
+        # Memoize predictions by feature vector; repeated applicants skip R entirely
+        self.cache = PredictionCache(int(os.environ.get("PREDICTION_CACHE_SIZE", "100000")))
+
+        self.ready = False
+        self.prewarm_result = None
+        self.prewarm_task = None
+        self.loop = None
+
+    def load_pmml_model(self):
+        """Load the PMML forest if the file and sklearn-pmml-model are available"""
+        if PMMLForestClassifier is None or not self.pmml_path or not os.path.exists(self.pmml_path):
+            return
+        logger.info(f"📦 Loading in-process PMML model from {self.pmml_path}")
+        self.pmml_model = PMMLForestClassifier(pmml=self.pmml_path)
+
+    async def start(self):
+        """Start the batch dispatcher and warm up the model in the background"""
+        self.load_pmml_model()
+        self.dispatcher.start()
+        self.prewarm_task = asyncio.get_running_loop().create_task(self.prewarm())
+
+    async def prewarm(self, retry_delay=5):
+        """Score PREWARM_INSTANCE until it succeeds, then mark the predictor ready"""
+        while not self.ready:
+            try:
+                if self.pmml_model is None and not self.rserve_host:
+                    await self.start_r_pool()
+                self.prewarm_result = await self.predict_one(PREWARM_INSTANCE)
+                self.ready = True
+                logger.info("🔥 Model warmed up, ready for traffic")
+            except Exception as e:
+                logger.error(f"Prewarm prediction failed, retrying in {retry_delay}s: {e}")
+                await asyncio.sleep(retry_delay)
+
+    def check_ready(self):
+        """Raise until the model is warm, since Seldon serves any returned health_status as 200"""
+        if not self.ready:
+            if SeldonMicroserviceException is not None:
+                raise SeldonMicroserviceException("Model is warming up", status_code=503)
+            raise RuntimeError("Model is warming up")
+
+    async def stop(self):
+        """Stop the dispatcher and the R worker pool"""
+        if self.prewarm_task is not None:
+            self.prewarm_task.cancel()
+            self.prewarm_task = None
+        await self.dispatcher.stop()
+        if self.r_pool is not None:
+            await self.r_pool.stop()
+            self.r_pool = None
+
+    def start_thread(self):
+        """Run the predictor on its own event loop thread for synchronous callers"""
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, name="r-predictor", daemon=True).start()
+        self.run_sync(self.start())
+
+    def run_sync(self, coro):
+        """Run a predictor coroutine on the background loop and wait for it"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    async def start_r_pool(self):
+        """Start (or replace a dead) R worker pool"""
+        if self.r_pool_lock is None:
+            self.r_pool_lock = asyncio.Lock()
+        async with self.r_pool_lock:
+            if self.r_pool is not None and self.r_pool.alive:
+                return
+            if self.r_pool is not None:
+                await self.r_pool.stop()
+            self.r_pool = RWorkerPool(self.rds_path, self.r_workers)
+            await self.r_pool.start()
+
+    def _run_rserve_batch(self, columns):
+        """Call predict_loan in the Rserve workspace over a persistent connection (blocking)"""
+        if pyRserve is None:
+            raise RuntimeError("RSERVE_HOST is set but pyRserve is not installed")
+
+        try:
+            if self.r_conn is None or self.r_conn.isClosed:
+                logger.info(f"🔌 Connecting to Rserve at {self.rserve_host}:{self.rserve_port}")
+                self.r_conn = pyRserve.connect(self.rserve_host, self.rserve_port)
+
+                # The sidecar loads its own MODEL_PATH; make sure it is our model
+                remote_model = os.path.basename(str(self.r_conn.eval("model_path")))
+                if remote_model != os.path.basename(self.rds_path):
+                    raise RuntimeError(
+                        f"Rserve sidecar serves {remote_model}, expected {os.path.basename(self.rds_path)}"
+                    )
+            result = self.r_conn.r.predict_loan(*columns.astype(np.float64))
+        except Exception as e:
+            # Drop the connection so the next request reconnects
+            if self.r_conn is not None:
+                self.r_conn.close()
+                self.r_conn = None
+            raise RuntimeError(f"R prediction failed: {e}")
+
+        return [
+            {"probability": float(p), "prediction": str(c), "confidence": float(conf)}
+            for p, c, conf in zip(
+                np.atleast_1d(result["probability"]),
+                np.atleast_1d(result["prediction"]),
+                np.atleast_1d(result["confidence"])
+            )
+        ]
+
+    async def _run_r_batch(self, columns, timeout=30):
+        """Send feature columns to R in one call and return one result per row"""
+        if self.rserve_host:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self._run_rserve_batch, columns)
+
+        if self.r_pool is None or not self.r_pool.alive:
+            await self.start_r_pool()
+        return results_from_probabilities(await self.r_pool.run(columns, timeout))
+
+    def _predict_in_process(self, columns):
+        """Score feature columns with the in-process PMML forest, same output as the R worker"""
+        X = columns.T.astype(np.float32)
+        approved = list(self.pmml_model.classes_).index("approved")
+        return results_from_probabilities(self.pmml_model.predict_proba(X)[:, approved])
+
+    async def predict_one(self, instance):
+        """
+        Predict for one instance (results are shared, do not mutate)
+
+        Raises ValueError for missing, non-integer or out-of-range features,
+        RuntimeError when R fails and asyncio.TimeoutError when R does not
+        answer
+        """
+        key = feature_key(instance)
+        result = self.cache.get(key)
+        if result is None:
+            if self.pmml_model is not None:
+                result = self._predict_in_process(feature_columns([key]))[0]
+            else:
+                result = await asyncio.wait_for(self.dispatcher.submit(key), 35)
+            self.cache.put(key, result)
+        return result
+
+    async def predict_batch(self, rows):
+        """Predict for many instances, sending every cache miss to R in one call"""
+        keys = []
+        for index, row in enumerate(rows):
+            try:
+                keys.append(feature_key(row))
+            except ValueError as e:
+                raise ValueError(f"Instance {index}: {e}")
+
+        results = [self.cache.get(key) for key in keys]
+        misses = list(dict.fromkeys(key for key, result in zip(keys, results) if result is None))
+        if misses:
+            columns = feature_columns(misses)
+            if self.pmml_model is not None:
+                scored = self._predict_in_process(columns)
+            else:
+                scored = await asyncio.wait_for(self.dispatcher.run_batch(columns), 35)
+            for key, result in zip(misses, scored):
+                self.cache.put(key, result)
+            fresh = dict(zip(misses, scored))
+            results = [fresh[key] if result is None else result for key, result in zip(keys, results)]
+        return results
@@ -5,11 +5,12 @@ Properly implements Seldon Core interface
 """
 
 import os
-import json
-import subprocess
 import logging
+import asyncio
 import numpy as np
 
+from r_predictor import RPredictor, FEATURES
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -21,45 +22,18 @@ class LoanApprovalModel:
     
     def __init__(self):
         self.model_loaded = False
-        self.feature_names = ["age", "income", "education", "experience", "credit_score"]
+        self.feature_names = FEATURES
         logger.info("🚀 Initializing Loan Approval Model")
         
-        # R prediction script
-        self.r_script = '''
-library(randomForest)
-library(jsonlite)
-
-# Load model
-model <- readRDS("/app/model/flask_random_forest.rds")
-
-# Read input from command line args
-args <- commandArgs(trailingOnly = TRUE)
-input_json <- args[1]
-input_data <- fromJSON(input_json)
-
-# Create data frame
-df <- data.frame(
-    age = input_data$age,
-    income = input_data$income,
-    education = input_data$education,
-    experience = input_data$experience,
-    credit_score = input_data$credit_score,
-    stringsAsFactors = FALSE
-)
+        self.predictor = RPredictor(
+            "/app/model/flask_random_forest.rds",
+            pmml_path=os.environ.get("PMML_MODEL_PATH", "/app/model/flask_random_forest.pmml")
+        )
 
-# Make prediction
-prediction <- predict(model, df, type = "prob")
-prob_approved <- prediction[,"approved"]
-
-# Return results
-result <- list(
-    probability = as.numeric(prob_approved),
-    prediction = ifelse(prob_approved > 0.5, "approved", "denied"),
-    confidence = as.numeric(abs(prob_approved - 0.5) * 2)
-)
-
-cat(toJSON(result, auto_unbox = TRUE))
-'''
+    def load(self):
+        """Load the PMML model and warm up the R workers (called by Seldon Core after fork)"""
+        self.predictor.start_thread()
+        self.model_loaded = True
 
     def predict(self, X, features_names=None):
         """
@@ -73,55 +47,48 @@ cat(toJSON(result, auto_unbox = TRUE))
             numpy array with predictions
         """
         try:
+            if not self.model_loaded:
+                self.load()
+            
             logger.info("📊 Processing prediction request")
             
             # Handle input format
             if isinstance(X, (list, np.ndarray)):
-                if len(X.shape) == 1:
+                X = np.asarray(X)
+                if X.ndim == 1:
                     # Single prediction
-                    values = X.tolist() if hasattr(X, 'tolist') else X
-                else:
-                    # Batch prediction - take first row for now
-                    values = X[0].tolist() if hasattr(X[0], 'tolist') else X[0]
-                    
-                # Create input dictionary
-                input_data = dict(zip(self.feature_names, values))
+                    X = X.reshape(1, -1)
             else:
                 raise ValueError("Unsupported input format")
             
-            logger.info(f"Input data: {input_data}")
+            logger.info(f"Input data: {X.shape[0]} rows")
             
-            # Execute R script
+            # Execute R prediction on the persistent workers; a single row joins
+            # the dispatcher's micro-batches, a batch is scored with one R call
             try:
-                process = subprocess.run(
-                    ['Rscript', '-e', self.r_script, json.dumps(input_data)],
-                    capture_output=True,
-                    text=True,
-                    timeout=30
-                )
-                
-                if process.returncode != 0:
-                    logger.error(f"R script error: {process.stderr}")
-                    return np.array([[0.5, 0.5]])  # Default prediction
-                
-                # Parse result
-                result = json.loads(process.stdout.strip())
+                rows = [dict(zip(FEATURES, row)) for row in X.tolist()]
+                if len(rows) == 1:
+                    results = [self.predictor.run_sync(self.predictor.predict_one(rows[0]))]
+                else:
+                    results = self.predictor.run_sync(self.predictor.predict_batch(rows))
                 
                 # Return probability array for Seldon Core
-                prob_denied = 1.0 - result["probability"]
-                prob_approved = result["probability"]
+                prob_approved = np.array([result["probability"] for result in results], dtype=float)
                 
-                logger.info(f"✅ Prediction: {result['prediction']} (prob: {prob_approved:.3f})")
+                logger.info(f"✅ Predicted {len(results)} rows (first: {results[0]['prediction']}, prob: {prob_approved[0]:.3f})")
                 
                 # Return as numpy array with shape (n_samples, n_classes)
-                return np.array([[prob_denied, prob_approved]])
+                return np.column_stack([1.0 - prob_approved, prob_approved])
                 
-            except subprocess.TimeoutExpired:
+            except asyncio.TimeoutError:
                 logger.error("R prediction timeout")
-                return np.array([[0.5, 0.5]])
+                return np.full((len(X), 2), 0.5)
+            except RuntimeError as e:
+                logger.error(f"R script error: {e}")
+                return np.full((len(X), 2), 0.5)  # Default prediction
             except Exception as e:
                 logger.error(f"R execution error: {e}")
-                return np.array([[0.5, 0.5]])
+                return np.full((len(X), 2), 0.5)
                 
         except Exception as e:
             logger.error(f"Prediction error: {e}")
@@ -129,14 +96,12 @@ cat(toJSON(result, auto_unbox = TRUE))
     
     def health_status(self):
         """Health check for Seldon Core"""
-        try:
-            model_exists = os.path.exists("/app/model/flask_random_forest.rds")
-            return {
-                "status": "healthy" if model_exists else "unhealthy",
-                "model_loaded": model_exists
-            }
-        except Exception as e:
-            return {"status": "error", "message": str(e)}
+        self.predictor.check_ready()
+        return {
+            "status": "healthy",
+            "model_loaded": True,
+            "prediction_cache": self.predictor.cache.stats()
+        }
 
     def init_metadata(self):
         """Metadata for Seldon Core"""
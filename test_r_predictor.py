@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Tests for the shared prediction core, run against a stub R worker that
+speaks the FIFO wire protocol instead of loading the model in R
+"""
+
+import os
+import sys
+import asyncio
+import unittest
+from unittest import mock
+
+import r_predictor
+from r_predictor import RPredictor, BatchDispatcher, PREWARM_INSTANCE, feature_key, feature_columns, pack_columns
+
+# Forks one responder per FIFO pair like r_prediction_script; approves
+# credit_score > 700 with probability 0.8, everything else with 0.2, and
+# exits mid-batch on age 99
+STUB_WORKER = r"""
+import os, sys, struct, time
+import numpy as np
+
+fifo_dir, size = sys.argv[2], int(sys.argv[3])
+for i in range(size):
+    if os.fork() == 0:
+        responses = open(os.path.join(fifo_dir, f"response{i}"), "wb")
+        requests = open(os.path.join(fifo_dir, f"request{i}"), "rb")
+        while True:
+            header = requests.read(4)
+            if len(header) < 4:
+                os._exit(0)
+            payload = requests.read(struct.unpack(">I", header)[0])
+            sizes = list(payload[:5])
+            rows = (len(payload) - 5) // sum(sizes)
+            credit_score = np.frombuffer(
+                payload, dtype=f"<i{sizes[4]}", offset=5 + rows * sum(sizes[:4]), count=rows
+            )
+            if 99 in np.frombuffer(payload, dtype=f"<i{sizes[0]}", offset=5, count=rows):
+                os._exit(1)
+            time.sleep(0.05)
+            reply = b"\x00" + np.where(credit_score > 700, 0.8, 0.2).astype("<f8").tobytes()
+            responses.write(struct.pack(">I", len(reply)) + reply)
+            responses.flush()
+while True:
+    try:
+        os.wait()
+    except ChildProcessError:
+        break
+"""
+
+
+def instance(credit_score):
+    return dict(PREWARM_INSTANCE, credit_score=credit_score)
+
+
+class FeatureKeyTest(unittest.TestCase):
+
+    def test_accepts_whole_numbers(self):
+        key = feature_key(dict(PREWARM_INSTANCE, age=30.0, income="50000"))
+        self.assertEqual(key, (30, 50000, 16, 5, 700))
+        self.assertTrue(all(type(value) is int for value in key))
+
+    def test_rejects_fractional_values(self):
+        with self.assertRaisesRegex(ValueError, "age must be an integer"):
+            feature_key(dict(PREWARM_INSTANCE, age=30.7))
+        with self.assertRaisesRegex(ValueError, "income must be an integer"):
+            feature_key(dict(PREWARM_INSTANCE, income="50000.5"))
+
+    def test_rejects_non_object_instances(self):
+        with self.assertRaisesRegex(ValueError, "Features must be given as an object"):
+            feature_key(1)
+
+    def test_rejects_bools(self):
+        with self.assertRaisesRegex(ValueError, "education must be an integer"):
+            feature_key(dict(PREWARM_INSTANCE, education=True))
+
+    def test_accepts_any_r_integer(self):
+        self.assertEqual(feature_key(dict(PREWARM_INSTANCE, age=17))[0], 17)
+        self.assertEqual(feature_key(dict(PREWARM_INSTANCE, income=2 ** 31 - 1))[1], 2 ** 31 - 1)
+        with self.assertRaisesRegex(ValueError, "income must be between"):
+            feature_key(dict(PREWARM_INSTANCE, income=2 ** 31))
+
+
+class PackColumnsTest(unittest.TestCase):
+
+    def test_columns_use_smallest_fitting_dtype(self):
+        keys = [(30, 50000, 16, 5, 700), (-128, 70000, 200, 5, 100000)]
+        payload = pack_columns(feature_columns(keys))
+        self.assertEqual(list(payload[:5]), [1, 4, 2, 1, 4])
+        self.assertEqual(len(payload), 5 + 2 * (1 + 4 + 2 + 1 + 4))
+
+
+class BatchDispatcherTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_full_batch_skips_batch_timeout(self):
+        batches = []
+
+        async def run_batch(columns):
+            batches.append(columns.shape[1])
+            return [{"probability": float(c)} for c in columns[4]]
+
+        dispatcher = BatchDispatcher(run_batch, batch_size=4, batch_timeout=1)
+        dispatcher.start()
+        self.addAsyncCleanup(dispatcher.stop)
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        first = asyncio.ensure_future(dispatcher.submit((30, 50000, 16, 5, 700)))
+        # Let run() take the first request before the rest of the batch arrives
+        await asyncio.sleep(0.01)
+        rest = [dispatcher.submit((30, 50000, 16, 5, 701 + i)) for i in range(3)]
+        results = await asyncio.wait_for(asyncio.gather(first, *rest), 5)
+
+        self.assertLess(loop.time() - started, 0.5)
+        self.assertEqual(batches, [4])
+        self.assertEqual([r["probability"] for r in results], [700, 701, 702, 703])
+
+
+class RPredictorTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        patches = [
+            mock.patch.object(r_predictor, "_R_ARGS", (sys.executable, "-c", STUB_WORKER)),
+            mock.patch.dict(os.environ, {"R_WORKERS": "1"}),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        os.environ.pop("RSERVE_HOST", None)
+
+        self.predictor = RPredictor("/stub/model.rds")
+        await self.predictor.start()
+        await asyncio.wait_for(self.predictor.prewarm_task, 10)
+
+    async def asyncTearDown(self):
+        await self.predictor.stop()
+
+    async def test_prewarm_marks_ready(self):
+        self.assertTrue(self.predictor.ready)
+        self.predictor.check_ready()
+        with self.assertRaisesRegex(Exception, "Model is warming up"):
+            RPredictor("/stub/model.rds").check_ready()
+        self.assertEqual(self.predictor.prewarm_result["prediction"], "denied")
+
+    async def test_wide_columns_reach_the_worker(self):
+        results = await asyncio.wait_for(
+            self.predictor.predict_batch([instance(650), dict(instance(100000), age=17)]), 5
+        )
+        self.assertEqual([r["prediction"] for r in results], ["denied", "approved"])
+
+    async def test_predict_batch_with_idle_dispatcher(self):
+        # An idle dispatcher must not hold the only worker slot
+        results = await asyncio.wait_for(
+            self.predictor.predict_batch([instance(650), instance(750)]), 5
+        )
+        self.assertEqual([r["prediction"] for r in results], ["denied", "approved"])
+
+    async def test_predict_one_and_batch_share_workers(self):
+        results = await asyncio.wait_for(asyncio.gather(
+            self.predictor.predict_one(instance(710)),
+            self.predictor.predict_batch([instance(720), instance(620)]),
+            self.predictor.predict_one(instance(630)),
+        ), 5)
+        self.assertEqual(results[0]["prediction"], "approved")
+        self.assertEqual([r["prediction"] for r in results[1]], ["approved", "denied"])
+        self.assertEqual(results[2]["prediction"], "denied")
+
+    async def test_worker_exit_replaces_pool(self):
+        pool = self.predictor.r_pool
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        with self.assertRaisesRegex(RuntimeError, "worker exited"):
+            await asyncio.wait_for(self.predictor.predict_batch([dict(instance(650), age=99)]), 5)
+        self.assertLess(loop.time() - started, 1)
+        self.assertFalse(pool.alive)
+
+        results = await asyncio.wait_for(self.predictor.predict_batch([instance(760)]), 10)
+        self.assertEqual(results[0]["prediction"], "approved")
+
+    async def test_cancelled_call_returns_channel(self):
+        pool = self.predictor.r_pool
+        task = asyncio.ensure_future(self.predictor.predict_batch([instance(640)]))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+
+        results = await asyncio.wait_for(self.predictor.predict_batch([instance(760)]), 5)
+        self.assertEqual(results[0]["prediction"], "approved")
+        self.assertIs(self.predictor.r_pool, pool)
+        self.assertEqual(pool.idle.qsize(), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()